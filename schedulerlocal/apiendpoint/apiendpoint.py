@@ -25,6 +25,7 @@ class ApiEndpoint(object):
         for req_attribute in req_attributes:
             if req_attribute not in kwargs: raise ValueError('Missing required argument', req_attributes)
             setattr(self, req_attribute, kwargs[req_attribute])
+        self.wake_callback = kwargs['wake_callback'] if 'wake_callback' in kwargs else None
 
     def run(self):
         """Run REST API on a separate thread
@@ -87,6 +88,7 @@ class ApiEndpoint(object):
 
         vm_to_create = DomainEntity(name=name, cpu=cpu, mem=mem, cpu_ratio=oc, qcow2=qcow2)
         success, reason = self.subset_manager_pool.deploy(vm_to_create)
+        if self.wake_callback != None: self.wake_callback() # Order an immediate scheduler iteration
         return {'success':success, 'reason':reason}
 
     def remove(self):
@@ -99,7 +101,7 @@ class ApiEndpoint(object):
             if request.args.get(arg) is None: return usage
         name = request.args.get('name')
         success, reason = self.subset_manager_pool.remove(name=name)
-        
+        if self.wake_callback != None: self.wake_callback() # Order an immediate scheduler iteration
         return {'success':success, 'reason':reason}
 
     def shutdown(self):
@@ -22,6 +22,9 @@ class DomainEntity:
     -------
     Getter/Setter
     """
+    # One instance per VM is held in the connector cache and traversed on every iteration:
+    # __slots__ keeps them compact and makes attribute access a fixed-offset load
+    __slots__ = ['name', 'mem', 'cpu', 'cpu_ratio', 'uuid', 'cpu_pin', 'qcow2', 'being_destroyed', 'epoch_ns', 'total']
 
     def __init__(self, **kwargs):
         req_attributes = ['name', 'mem', 'cpu', 'cpu_ratio']
@@ -122,22 +125,20 @@ class DomainEntity:
         """Return if CPU times were initialised
         ----------
         """
-        return hasattr(self, 'epoch_ns') and hasattr(self, 'total') and hasattr(self, 'system') and hasattr(self, 'user')
+        return hasattr(self, 'epoch_ns') and hasattr(self, 'total')
 
-    def set_time(self, epoch_ns : int, total : int, system: int, user : int):
+    def set_time(self, epoch_ns : int, total : int):
         """Set CPU time
         ----------
         """
         setattr(self, 'epoch_ns', epoch_ns)
         setattr(self, 'total', total)
-        setattr(self, 'system', system)
-        setattr(self, 'user', user)
 
     def get_time(self):
         """Return CPU time
         ----------
         """
-        return getattr(self, 'epoch_ns'), getattr(self, 'total'), getattr(self, 'system'), getattr(self, 'user')
+        return getattr(self, 'epoch_ns'), getattr(self, 'total')
 
     def clear_time(self):
         """Remove registered CPU time
@@ -145,8 +146,12 @@ class DomainEntity:
         """
         if hasattr(self, 'epoch_ns'): delattr(self, 'epoch_ns')
         if hasattr(self, 'total'): delattr(self, 'total')
-        if hasattr(self, 'system'): delattr(self, 'system')
-        if hasattr(self, 'user'): delattr(self, 'user')
+
+    def to_dict(self):
+        """Return attributes as dict (__slots__ leaves no __dict__ for serialization)
+        ----------
+        """
+        return {attribute: getattr(self, attribute) for attribute in self.__slots__ if hasattr(self, attribute)}
 
     def __str__(self):
         """Convert state to string
@@ -1,7 +1,11 @@
-import libvirt, time
+import libvirt, time, threading
+import concurrent.futures
 from schedulerlocal.domain.libvirtxmlmodifier import xmlDomainNuma, xmlDomainMetaData, xmlDomainCputune
 from schedulerlocal.domain.domainentity import DomainEntity
 
+RECONNECT_BACKOFF_INIT_SEC = 0.5
+RECONNECT_BACKOFF_MAX_SEC  = 30
+
 class LibvirtConnector(object):
     """
     A class used as an interface with libvirt API
@@ -18,14 +22,101 @@ class LibvirtConnector(object):
         for req_attribute in req_attributes:
             if req_attribute not in kwargs: raise ValueError('Missing required argument', req_attributes)
             setattr(self, req_attribute, kwargs[req_attribute])
-        # Connect to libvirt url    
+        # Connect to libvirt url
+        libvirt.virEventRegisterDefaultImpl() # Must precede open() for lifecycle event support
         self.conn = libvirt.open(self.url)
         if not self.conn:
             raise SystemExit('Failed to open connection to ' + self.url)
         self.cache_entity = dict()
+        self.cache_stats = dict()
+        self.cache_stats_epoch_ns = None
+        self.cache_xml = dict()
+        self.last_pin_template = dict()
+        self.cache_pin_template = dict()
+        self.vir_by_uuid = dict()
+        self.parallel_fallback_workers = 8 # Set to 0 to keep per-VM collection sequential on libvirtd-saturated hosts
+        self.stats_pool = None
+        self.conn_lock = threading.Lock()
+        self.live_uuids = set()
+        self.live_lock = threading.Lock()
+        self.lifecycle_events = False
+        self.event_thread = threading.Thread(target=self.__run_event_loop, daemon=True)
+        self.event_thread.start()
+        self.__register_lifecycle_events()
 
         with open('static/template-vm.xml', 'r') as f: self.template_vm = f.read()
 
+    def __run_event_loop(self):
+        """Dispatch libvirt events forever. Runs on a daemon thread
+        ----------
+        """
+        while True: libvirt.virEventRunDefaultImpl()
+
+    def __register_lifecycle_events(self):
+        """Subscribe to domain lifecycle events and seed the live VM set, so the iteration
+        loop can read a locally maintained set instead of polling the domain list
+        ----------
+        """
+        try:
+            self.conn.domainEventRegisterAny(None, libvirt.VIR_DOMAIN_EVENT_ID_LIFECYCLE, self.__on_lifecycle_event, None)
+            with self.live_lock:
+                self.live_uuids = {virDomain.UUIDString() for virDomain in self.conn.listAllDomains(libvirt.VIR_CONNECT_LIST_DOMAINS_ACTIVE)}
+            self.lifecycle_events = True
+        except libvirt.libvirtError as ex:
+            self.lifecycle_events = False
+            print('Warning: libvirt lifecycle events unavailable, falling back to domain listing per iteration')
+
+    def __on_lifecycle_event(self, conn, virDomain, event, detail, opaque):
+        """Callback maintaining the live VM set and invalidating per-VM caches on lifecycle transitions
+        ----------
+        """
+        uuid = virDomain.UUIDString()
+        if event == libvirt.VIR_DOMAIN_EVENT_STARTED:
+            with self.live_lock: self.live_uuids.add(uuid)
+            self.vir_by_uuid[uuid] = virDomain
+        elif event in (libvirt.VIR_DOMAIN_EVENT_STOPPED, libvirt.VIR_DOMAIN_EVENT_UNDEFINED, libvirt.VIR_DOMAIN_EVENT_CRASHED):
+            with self.live_lock: self.live_uuids.discard(uuid)
+            self.vir_by_uuid.pop(uuid, None)
+            self.cache_entity.pop(uuid, None)
+            self.last_pin_template.pop(uuid, None)
+        # Domain XML may have been redefined on any lifecycle transition
+        self.cache_xml.pop(uuid, None)
+
+    def _conn(self):
+        """Return a live libvirt connection, reconnecting with exponential backoff if libvirtd restarted
+        ----------
+
+        Returns
+        -------
+        conn : libvirt.virConnect
+            Live connection handle
+        """
+        try:
+            if self.conn.isAlive(): return self.conn
+        except libvirt.libvirtError as ex:
+            pass
+        with self.conn_lock:
+            # Another thread may have reconnected while we waited on the lock
+            try:
+                if self.conn.isAlive(): return self.conn
+            except libvirt.libvirtError as ex:
+                pass
+            backoff = RECONNECT_BACKOFF_INIT_SEC
+            while True:
+                print('Warning: libvirt connection lost, reconnecting to', self.url)
+                try:
+                    self.conn = libvirt.open(self.url)
+                    if self.conn: break
+                except libvirt.libvirtError as ex:
+                    pass
+                time.sleep(backoff)
+                backoff = min(backoff*2, RECONNECT_BACKOFF_MAX_SEC)
+            # Cached handles, stats and event subscription were bound to the previous connection
+            self.vir_by_uuid.clear()
+            self.cache_stats.clear()
+            self.__register_lifecycle_events()
+        return self.conn
+
     def get_vm_alive(self):
         """Retrieve list of VM being running currently as libvirt object
         ----------
@@ -35,14 +126,125 @@ class LibvirtConnector(object):
         vm_alive : list
             list of virDomain
         """
-        res = list()
-        for domain_id in self.conn.listDomainsID():
-            try:
-                virDomain = self.conn.lookupByID(domain_id)
-                res.append(virDomain)
-            except libvirt.libvirtError as ex:  # VM is not alived anymore
-                pass
-        return res
+        if self.lifecycle_events:
+            with self.live_lock: uuids = list(self.live_uuids)
+            res = list()
+            for uuid in uuids:
+                try:
+                    res.append(self._vir(uuid))
+                except libvirt.libvirtError as ex: # VM is not alived anymore
+                    pass
+            return res
+        return self._conn().listAllDomains(libvirt.VIR_CONNECT_LIST_DOMAINS_ACTIVE)
+
+    def get_all_domain_stats(self, stats : int = None):
+        """Retrieve stats of all running VM in a single bulk RPC call
+        ----------
+
+        Parameters
+        ----------
+        stats : int
+            Combination of VIR_DOMAIN_STATS_* flags (defaulted if not specified)
+
+        Returns
+        -------
+        stats_list : list
+            list of (virDomain, stats dict) tuples
+        """
+        if stats is None:
+            stats = libvirt.VIR_DOMAIN_STATS_STATE | libvirt.VIR_DOMAIN_STATS_CPU_TOTAL |\
+                libvirt.VIR_DOMAIN_STATS_BALLOON | libvirt.VIR_DOMAIN_STATS_VCPU
+        return self._conn().getAllDomainStats(stats, libvirt.VIR_CONNECT_GET_ALL_DOMAINS_STATS_RUNNING)
+
+    def refresh_stats_snapshot(self):
+        """Refresh the stats snapshot of all running VM. Meant to be called once per scheduler iteration
+        get_usage_cpu() and get_usage_mem() read from this snapshot instead of issuing per-VM RPC calls
+        ----------
+        """
+        epoch_ns = time.time_ns()
+        cache_stats = dict()
+        try:
+            for virDomain, stats in self.get_all_domain_stats():
+                cache_stats[virDomain.UUIDString()] = (virDomain, stats)
+        except AttributeError as ex: # Bulk API not exposed by this libvirt, collect per VM
+            cache_stats = self.__refresh_stats_per_vm()
+        except libvirt.libvirtError as ex:
+            return # Snapshot kept unchanged, consumers will be treated on next refresh
+        self.cache_stats = cache_stats
+        self.cache_stats_epoch_ns = epoch_ns
+
+    def __refresh_stats_per_vm(self):
+        """Per-VM fallback of refresh_stats_snapshot for libvirt versions without getAllDomainStats
+        libvirtd being mostly I/O bound on its RPC socket, the per-VM calls are spread over a thread
+        pool (the libvirt binding releases the GIL during RPC)
+        ----------
+
+        Returns
+        -------
+        cache_stats : dict
+            dict of uuid to (virDomain, stats dict)
+        """
+        cache_stats = dict()
+        vm_alive = self.get_vm_alive()
+        if (self.parallel_fallback_workers > 1) and (len(vm_alive) > 1):
+            if self.stats_pool is None:
+                self.stats_pool = concurrent.futures.ThreadPoolExecutor(max_workers=self.parallel_fallback_workers)
+            futures = [self.stats_pool.submit(self.__stats_of_single_vm, virDomain) for virDomain in vm_alive]
+            for future in concurrent.futures.as_completed(futures):
+                try:
+                    uuid, entry = future.result()
+                    cache_stats[uuid] = entry
+                except libvirt.libvirtError as ex: # VM is not alived anymore
+                    pass
+        else:
+            for virDomain in vm_alive:
+                try:
+                    uuid, entry = self.__stats_of_single_vm(virDomain)
+                    cache_stats[uuid] = entry
+                except libvirt.libvirtError as ex: # VM is not alived anymore
+                    pass
+        return cache_stats
+
+    def __stats_of_single_vm(self, virDomain : libvirt.virDomain):
+        """Collect stats of a single VM, exposing the same keys as the bulk API
+        ----------
+
+        Parameters
+        ----------
+        virDomain : libvirt.virDomain
+            domain to consider
+
+        Returns
+        -------
+        entry : tuple
+            (uuid, (virDomain, stats dict))
+        """
+        stats = dict()
+        stats['cpu.time'] = virDomain.getCPUStats(total=True)[0]['cpu_time']
+        memory_stats = virDomain.memoryStats()
+        if 'rss' in memory_stats: stats['balloon.rss'] = memory_stats['rss']
+        if 'actual' in memory_stats: stats['balloon.current'] = memory_stats['actual']
+        return (virDomain.UUIDString(), (virDomain, stats))
+
+    def _vir(self, uuid : str):
+        """Return the virDomain handle associated to a VM uuid. Handles are stable for the domain
+        lifetime so they are cached instead of paying a lookupByUUIDString RPC on each use
+        ----------
+
+        Parameters
+        ----------
+        uuid : str
+            VM uuid
+
+        Returns
+        -------
+        virDomain : libvirt.virDomain
+            Libvirt domain handle
+        """
+        if uuid in self.vir_by_uuid: return self.vir_by_uuid[uuid]
+        virDomain = self._conn().lookupByUUIDString(uuid)
+        self.vir_by_uuid[uuid] = virDomain
+        return virDomain
 
     def get_vm_alive_as_entity(self):
         """Retrieve list of VM being running currently as DomainEntity object
@@ -68,14 +270,7 @@ class LibvirtConnector(object):
         vm_shutdown : list
             list of virDomain
         """
-        res = list()
-        for domain_name in self.conn.listDefinedDomains():
-            try:
-                virDomain = self.conn.lookupByName(domain_name)
-                res.append(virDomain)
-            except libvirt.libvirtError as ex:  # VM is not defined anymore
-                pass
-        return res
+        return self._conn().listAllDomains(libvirt.VIR_CONNECT_LIST_DOMAINS_INACTIVE)
 
     def get_all_vm(self):
         """Retrieve list of all VM
@@ -86,9 +281,7 @@ class LibvirtConnector(object):
         vm_list : list
             list of virDomain
         """
-        vm_list = self.get_vm_alive()
-        vm_list.extend(self.get_vm_shutdown())
-        return vm_list
+        return self._conn().listAllDomains(0)
 
     def convert_to_entitydomain(self, virDomain : libvirt.virDomain, force_update = False):
         """Convert the libvirt virDomain object to the domainEntity domain
@@ -110,21 +303,28 @@ class LibvirtConnector(object):
         try:
             # Cache management
             uuid = virDomain.UUIDString()
-            if (not force_update) and uuid in self.cache_entity: return self.cache_entity[uuid]
-            # General info
-            name = virDomain.name()
-            mem = virDomain.maxMemory()
-            cpu = virDomain.maxVcpus()
+            if not force_update:
+                try: return self.cache_entity[uuid]
+                except KeyError: pass
             cpu_pin = virDomain.vcpuPinInfo()
-            # Custom metadata
-            xml_manager = xmlDomainMetaData(xml_as_str=virDomain.XMLDesc())
-            xml_manager.convert_to_object()
-            if xml_manager.updated() : 
-                self.conn.defineXML(xml_manager.convert_to_str_xml()) # Will only be applied after a restart
-                print('Warning, no oversubscription found on domain', name, ': defaults were generated')
+            if (not force_update) and uuid in self.cache_xml:
+                # Domain XML is static between config changes, reuse parsed metadata
+                name, mem, cpu, cpu_ratio = self.cache_xml[uuid]
+            else:
+                # General info
+                name = virDomain.name()
+                mem = virDomain.maxMemory()
+                cpu = virDomain.maxVcpus()
+                # Custom metadata
+                xml_manager = xmlDomainMetaData(xml_as_str=virDomain.XMLDesc())
+                xml_manager.convert_to_object()
+                if xml_manager.updated() :
+                    self._conn().defineXML(xml_manager.convert_to_str_xml()) # Will only be applied after a restart
+                    print('Warning, no oversubscription found on domain', name, ': defaults were generated')
+                cpu_ratio = xml_manager.get_oversub_ratios()['cpu']
+                self.cache_xml[uuid] = (name, mem, cpu, cpu_ratio)
         except libvirt.libvirtError as ex:  # VM is not alived anymore
             return None
-        cpu_ratio = xml_manager.get_oversub_ratios()['cpu']
         # Build entity
         self.cache_entity[uuid] = DomainEntity(uuid=uuid, name=name, mem=mem, cpu=cpu, cpu_pin=cpu_pin, cpu_ratio=cpu_ratio)
         return self.cache_entity[uuid]
@@ -140,25 +340,33 @@ class LibvirtConnector(object):
         virDomain : virDomain
             Libvirt model (retrieve if based on uuid if not specified)
         """
+        # Skip pinning RPC calls when the requested template was already applied
+        uuid = vm.get_uuid()
+        template_pin = tuple(vm.get_cpu_pin())
+        if self.last_pin_template.get(uuid) == template_pin: return
         # Retrieve VM
         vm_pin_current = None
+        applied = True
         try:
-            if virDomain == None: virDomain = self.conn.lookupByUUIDString(vm.get_uuid())
+            if virDomain == None: virDomain = self._vir(uuid)
             vm_pin_current = virDomain.vcpuPinInfo()
             vm_pin_model   = vm.get_cpu_pin()
 
-            for vcpu, cpu_pin_current in enumerate(vm_pin_current):
-                if cpu_pin_current != vm_pin_model[vcpu]:
-                    virDomain.pinVcpu(vcpu, vm_pin_model[vcpu]) # Live setting
+            # Single C-level tuple compare short-circuits the common all-equal case
+            if tuple(vm_pin_current) != tuple(vm_pin_model):
+                for vcpu, cpu_pin_current in enumerate(vm_pin_current):
+                    if cpu_pin_current != vm_pin_model[vcpu]:
+                        virDomain.pinVcpu(vcpu, vm_pin_model[vcpu]) # Live setting
         except libvirt.libvirtError as ex:  # VM is not alived anymore
-            pass
+            applied = False
         # Update XML desc
         try:
             host_config = len(vm.get_cpu_pin()[0])
             cputune_xml = xmlDomainCputune(xml_as_str=virDomain.XMLDesc(), host_config=host_config, cpupin_per_vcpu=vm.get_cpu_pin())
-            virDomain = self.conn.defineXML(cputune_xml.convert_to_str_xml())
+            virDomain = self._conn().defineXML(cputune_xml.convert_to_str_xml())
         except Exception as ex:
-            pass
+            applied = False
+        if applied: self.last_pin_template[uuid] = template_pin
 
     def build_cpu_pinning(self, cpu_list : list, host_config : int):
         """Return Libvirt template of cpu pinning based on authorised list of cpu
@@ -176,16 +384,21 @@ class LibvirtConnector(object):
         template : Tuple
             Pinning template
         """
+        cache_key = (host_config, frozenset(cpu.get_cpu_id() for cpu in cpu_list))
+        if cache_key in self.cache_pin_template: return self.cache_pin_template[cache_key]
         template_pin = [False for is_cpu_pinned in range(host_config)]
-        for cpu in cpu_list: template_pin[cpu.get_cpu_id()] = True
-        return tuple(template_pin)
+        for cpu_id in cache_key[1]: template_pin[cpu_id] = True
+        self.cache_pin_template[cache_key] = tuple(template_pin)
+        return self.cache_pin_template[cache_key]
 
     def cache_purge(self):
         """Purge cache associating VM uuid to their domainentity representation
         ----------
         """
-        del self.cache_entity
-        self.cache_entity = dict()
+        self.cache_entity.clear()
+        self.cache_xml.clear()
+        self.last_pin_template.clear()
+        self.vir_by_uuid.clear()
 
     def get_usage_cpu(self, vm : DomainEntity):
         """Return the latest CPU usage of a given VM. None if unable to compute it (as delta are required)
@@ -201,20 +414,18 @@ class LibvirtConnector(object):
         cpu_usage : float
             Usage as [0;1]
         """
-        try:
-            virDomain = self.conn.lookupByUUIDString(vm.get_uuid())
-            epoch_ns = time.time_ns()
-            stats = virDomain.getCPUStats(total=True)
-        except libvirt.libvirtError as ex:  # VM is not alived
-            raise ConsumerNotAlived()
-        total, system, user = (stats[0]['cpu_time'], stats[0]['system_time'], stats[0]['user_time'])
+        if vm.get_uuid() not in self.cache_stats: raise ConsumerNotAlived() # VM is not alived
+        virDomain, stats = self.cache_stats[vm.get_uuid()]
+        epoch_ns = self.cache_stats_epoch_ns
+        total = stats.get('cpu.time')
+        if total is None: raise ConsumerNotAlived() # Stats not exposed for this domain
         cpu_usage_norm = None
         if vm.has_time(): # Compute delta
-            prev_epoch, prev_total, prev_system, prev_user = vm.get_time()
+            prev_epoch, prev_total = vm.get_time()
+            if epoch_ns == prev_epoch: return cpu_usage_norm # Snapshot was not refreshed since last call
             cpu_usage = (total-prev_total)/(epoch_ns-prev_epoch)
-            cpu_usage_norm = cpu_usage / vm.get_cpu()
-            if cpu_usage_norm>1: cpu_usage_norm = 1
-        vm.set_time(epoch_ns=epoch_ns,total=total, system=system, user=user)
+            cpu_usage_norm = min(1.0, cpu_usage / vm.get_cpu())
+        vm.set_time(epoch_ns=epoch_ns,total=total)
         return cpu_usage_norm
 
     def get_usage_mem(self, vm : DomainEntity):
@@ -231,15 +442,12 @@ class LibvirtConnector(object):
         cpu_usage : float
             Usage as [0;1]
         """
-        try:
-            virDomain = self.conn.lookupByUUIDString(vm.get_uuid())
-            stats = virDomain.memoryStats()
-        except libvirt.libvirtError as ex:  # VM is not alived
-            raise ConsumerNotAlived()
-        #keys = ['actual', 'available', 'rss', 'major_fault']
-        usage = stats['rss']/stats['actual']
-        if usage>1: return 1
-        return usage
+        if vm.get_uuid() not in self.cache_stats: raise ConsumerNotAlived() # VM is not alived
+        virDomain, stats = self.cache_stats[vm.get_uuid()]
+        # A freshly started (or ballooned down to zero) VM may report no balloon value yet
+        actual = stats.get('balloon.current', 0)
+        if not actual: return 0.0
+        return min(1.0, stats.get('balloon.rss', 0)/actual)
 
     def create_vm(self, vm : DomainEntity):
         """Create a VM based on its DomainEntity description
@@ -270,7 +478,7 @@ class LibvirtConnector(object):
         cputune_xml = xmlDomainCputune(xml_as_str=vm_xml, host_config=host_config, cpupin_per_vcpu=vm.get_cpu_pin())
         virDomain = None
         try:
-            virDomain = self.conn.defineXML(cputune_xml.convert_to_str_xml())
+            virDomain = self._conn().defineXML(cputune_xml.convert_to_str_xml())
             virDomain.create()
         except libvirt.libvirtError as ex1:
             try:
@@ -300,7 +508,7 @@ class LibvirtConnector(object):
             Success as True/False with reason
         """
         try:
-            virDomain = self.conn.lookupByUUIDString(vm.get_uuid())
+            virDomain = self._conn().lookupByUUIDString(vm.get_uuid())
         except libvirt.libvirtError as ex: # Already deleted
             return (True, None)
         try:
@@ -308,6 +516,9 @@ class LibvirtConnector(object):
             virDomain.undefine()
         except libvirt.libvirtError as ex:
             return (False, str(ex))
+        self.cache_xml.pop(vm.get_uuid(), None)
+        self.last_pin_template.pop(vm.get_uuid(), None)
+        self.vir_by_uuid.pop(vm.get_uuid(), None)
         return (True, None)
 
     def __del__(self):
@@ -78,7 +78,7 @@ class SubsetEncoder(JSONEncoder):
             return
 
         as_dict = {'res_list':None, 'consumer_list':None}
-        as_dict['consumer_list'] = [vm.__dict__ for vm in o.get_consumers()]
+        as_dict['consumer_list'] = [vm.to_dict() for vm in o.get_consumers()]
         if type(o) is CpuSubset:
             as_dict['res_list'] = [ServerCpuSetEncoder.convert_cpu_to_dict(cpu) for cpu in o.get_res()]
         elif type(o) is MemSubset:
@@ -1,7 +1,11 @@
-import time
+import time, threading
 from schedulerlocal.subset.subsetmanager import SubsetManagerPool
 from schedulerlocal.apiendpoint.apiendpoint import ApiEndpoint
 
+NS_PER_SEC = 10**9
+ACTIVITY_THRESHOLD = 0.05 # Usage delta under which VMs are considered idle
+MAX_DELAY_FACTOR   = 8    # Upper bound of the adaptive delay back-off
+
 class SchedulerLocal:
     """
     Main class of the program : watch cpuset usage and VM usage to propose resources
@@ -18,31 +22,51 @@ class SchedulerLocal:
             if req_attribute not in kwargs: raise ValueError('Missing required argument', req_attributes)
             setattr(self, req_attribute, kwargs[req_attribute])
         
+        self.wake_event = threading.Event()
         self.managers_pool = SubsetManagerPool(**kwargs)
         self.api_endpoint = ApiEndpoint(subset_manager_pool=self.managers_pool,
-            api_url=kwargs['api_url'], api_port=kwargs['api_port'])
+            api_url=kwargs['api_url'], api_port=kwargs['api_port'], wake_callback=self.wake)
         self.api_endpoint.run()
 
+    def wake(self):
+        """Interrupt the current idle sleep so the next iteration starts immediately
+        ----------
+        """
+        self.wake_event.set()
+
     def run(self):
         """Run scheduler with specified delay
         ----------
         """
-        launch_at = time.time_ns()
+        # Hoist lookups out of the tick loop. Monotonic clock keeps delay math immune to NTP/DST steps
+        time_ns  = time.monotonic_ns
+        sleep    = self.wake_event.wait # Interruptible by wake(), unlike time.sleep
+        wake_ack = self.wake_event.clear
+        iterate  = self.managers_pool.iterate
+        last_activity = self.managers_pool.last_activity
+        delay_ns = self.delay*NS_PER_SEC
+        max_delay_ns = delay_ns*MAX_DELAY_FACTOR
+        cur_delay_ns = delay_ns
+        launch_at = time_ns()
+        next_deadline = launch_at + delay_ns
         while True:
-            time_begin = time.time_ns()
+            time_begin = time_ns()
 
-            self.__iteration(time_since_launch=int((time_begin-launch_at)/(10**9)))
-            
-            time_to_sleep = (self.delay*10**9) - (time.time_ns() - time_begin)
-            if time_to_sleep>0: time.sleep(time_to_sleep/10**9)
-            else: print('Warning: overlap iteration', -(time_to_sleep/10**9), 's')
-        
-    def __iteration(self, time_since_launch : int):
-        """Execute all actions related to an iteration
-        ----------
+            iterate(timestamp=int((time_begin-launch_at)/NS_PER_SEC))
 
-        """
-        self.managers_pool.iterate(timestamp=time_since_launch)
+            # Adaptive delay: back off while usage is stable, reset to the configured delay otherwise
+            activity = last_activity()
+            if (activity is not None) and (activity < ACTIVITY_THRESHOLD): cur_delay_ns = min(cur_delay_ns*2, max_delay_ns)
+            else: cur_delay_ns = delay_ns
+
+            # Align on absolute deadlines so short iterations do not accumulate drift
+            time_to_sleep = next_deadline - time_ns()
+            if time_to_sleep>0:
+                sleep(time_to_sleep/NS_PER_SEC)
+                wake_ack()
+            else: print('Warning: overlap iteration', -(time_to_sleep/NS_PER_SEC), 's')
+            # Advance only past deadlines, so early wake() iterations do not push the cadence out
+            while next_deadline <= time_ns(): next_deadline += cur_delay_ns
 
     def __del__(self):
         """Clean endpoint on shutdown
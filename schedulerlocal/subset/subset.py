@@ -39,6 +39,8 @@ class Subset(object):
         for opt_attribute in opt_attributes:
             opt_val = kwargs[opt_attribute] if opt_attribute in kwargs else list()
             setattr(self, opt_attribute, opt_val)
+        self.last_usage = None
+        self.last_activity = None
 
     def get_oversubscription_id(self):
         """Get subset id
@@ -302,6 +304,17 @@ class Subset(object):
         """
         return self.endpoint_pool.load_subset(subset=self) # TODO
 
+    def get_last_activity(self):
+        """Return usage variation observed between the two last monitoring sessions
+        ----------
+
+        Returns
+        -------
+        activity : float
+            Absolute usage delta [0;1]. None if unknown (e.g. first iterations)
+        """
+        return self.last_activity
+
     def get_oversubscription(self):
         """Getter on oversubscription computation
 
@@ -392,6 +405,11 @@ class Subset(object):
             If VM left under the scope of the scheduler (without passing by manager), return True
         """
         current_usage, current_vm_usage = self.endpoint_pool.load_subset(timestamp=timestamp, subset=self)
+        # Track the usage variation between monitoring sessions for the adaptive scheduler delay
+        if (current_usage is not None) and (self.last_usage is not None):
+            self.last_activity = abs(current_usage - self.last_usage)
+        else: self.last_activity = None
+        self.last_usage = current_usage
         clean_needed = False
         for consumer in self.consumer_list: # Update consumer list
             if consumer.get_uuid() not in current_vm_usage.keys(): 
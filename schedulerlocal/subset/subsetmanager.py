@@ -255,6 +255,22 @@ class SubsetManager(object):
         clean_needed_list = self.collection.update_monitoring(timestamp=timestamp)
         for subset in clean_needed_list: self.shrink_subset(subset)
 
+    def last_activity(self):
+        """Return the highest usage variation observed across subsets on the last monitoring session
+        ----------
+
+        Returns
+        -------
+        activity : float
+            Max absolute usage delta [0;1]. None if unknown (e.g. first iterations)
+        """
+        activity = 0
+        for subset in self.collection.get_subsets():
+            subset_activity = subset.get_last_activity()
+            if subset_activity is None: return None
+            if subset_activity > activity: activity = subset_activity
+        return activity
+
     def status(self):
         """Return susbset status as dict
         ----------
@@ -841,6 +857,7 @@ class SubsetManagerPool(object):
         """Iteration
         ----------
         """
+        self.connector.refresh_stats_snapshot() # Single bulk RPC instead of per-VM calls
         for subset_manager in self.subset_managers.values():
             subset_manager.update_monitoring(timestamp=timestamp)
         # Print status to console if context changed
@@ -848,6 +865,22 @@ class SubsetManagerPool(object):
         if not hasattr(self, 'prev_status_str') or getattr(self, 'prev_status_str') != status_str: print(status_str)
         setattr(self, 'prev_status_str', status_str)
 
+    def last_activity(self):
+        """Return the highest usage variation observed across subset managers on the last iteration
+        ----------
+
+        Returns
+        -------
+        activity : float
+            Max absolute usage delta [0;1]. None if unknown (e.g. first iterations)
+        """
+        activity = 0
+        for subset_manager in self.subset_managers.values():
+            manager_activity = subset_manager.last_activity()
+            if manager_activity is None: return None
+            if manager_activity > activity: activity = manager_activity
+        return activity
+
     def deploy(self, vm : DomainEntity):
         """Deploy a VM on subset managers
         ----------